@@ -4,10 +4,12 @@ from pydantic import BaseModel, EmailStr
 from typing import List, Optional
 import os
 import asyncio
+import aiofiles
 from dotenv import load_dotenv
 from rag_service import RAGService
 from datetime import datetime
 import json
+import uuid
 
 load_dotenv()
 
@@ -21,7 +23,88 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-rag_service = RAGService()
+# Created on startup so models load only in processes that serve requests,
+# not in the uvicorn supervisor or when a worker re-executes this file
+rag_service: Optional[RAGService] = None
+
+UPLOAD_CHUNK_SIZE = 1 << 20
+OLLAMA_KEEPALIVE_INTERVAL = int(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "240"))
+
+async def ollama_keepalive_loop():
+    """Periodically ping Ollama so the model is never unloaded while idle"""
+    while True:
+        try:
+            await asyncio.to_thread(rag_service.ping_ollama)
+        except Exception as e:
+            print(f"Ollama keep-alive ping failed: {str(e)}")
+        await asyncio.sleep(OLLAMA_KEEPALIVE_INTERVAL)
+
+REQUESTS_DIR = "requests"
+REQUESTS_FSYNC_INTERVAL = 0.1
+
+# Request files appended to since the last fsync
+pending_fsync = set()
+requests_written = asyncio.Event()
+
+def requests_file(when: datetime) -> str:
+    return os.path.join(REQUESTS_DIR, f"requests-{when.strftime('%Y%m%d')}.jsonl")
+
+def fsync_file(path: str):
+    # Windows can only fsync (_commit) a handle opened for writing
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+async def requests_fsync_loop():
+    """Coalesce fsyncs of submitted requests into one per interval"""
+    while True:
+        await requests_written.wait()
+        await asyncio.sleep(REQUESTS_FSYNC_INTERVAL)
+        requests_written.clear()
+        paths = list(pending_fsync)
+        pending_fsync.clear()
+        for path in paths:
+            try:
+                await asyncio.to_thread(fsync_file, path)
+            except Exception as e:
+                print(f"Error syncing {path}: {str(e)}")
+
+@app.on_event("startup")
+def load_rag_service():
+    global rag_service
+    rag_service = RAGService()
+
+@app.on_event("startup")
+async def start_requests_writer():
+    os.makedirs(REQUESTS_DIR, exist_ok=True)
+    app.state.fsync_task = asyncio.create_task(requests_fsync_loop())
+
+@app.on_event("startup")
+async def start_keepalive():
+    if rag_service.uses_ollama():
+        app.state.keepalive_task = asyncio.create_task(ollama_keepalive_loop())
+
+@app.on_event("shutdown")
+def save_caches():
+    rag_service.save_caches()
+    rag_service.close()
+
+@app.on_event("shutdown")
+def stop_keepalive():
+    task = getattr(app.state, "keepalive_task", None)
+    if task:
+        task.cancel()
+
+@app.on_event("shutdown")
+def flush_requests():
+    app.state.fsync_task.cancel()
+    for path in pending_fsync:
+        try:
+            fsync_file(path)
+        except Exception as e:
+            print(f"Error syncing {path}: {str(e)}")
 
 class Question(BaseModel):
     question: str
@@ -79,17 +162,25 @@ async def upload_bylaws(file: UploadFile = File(...)):
         # Ensure documents directory exists
         os.makedirs("documents", exist_ok=True)
         
-        # Read file content
-        content = await file.read()
-        
-        # Validate file is not empty
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="Uploaded file is empty")
-        
-        # Save file
+        # Stream the upload in 1 MB chunks to a temp file (not *.pdf, so
+        # reindex.py ignores it) and only replace the document once it's valid
         file_path = os.path.join("documents", file.filename)
-        with open(file_path, "wb") as f:
-            f.write(content)
+        tmp_path = f"{file_path}.part-{uuid.uuid4().hex}"
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    await f.write(chunk)
+            
+            # Validate file is not empty
+            if size == 0:
+                raise HTTPException(status_code=400, detail="Uploaded file is empty")
+            
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         
         # Index document
         await rag_service.index_document(file_path)
@@ -97,7 +188,7 @@ async def upload_bylaws(file: UploadFile = File(...)):
         return {
             "message": f"Document {file.filename} uploaded and indexed successfully",
             "filename": file.filename,
-            "size": len(content)
+            "size": size
         }
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -111,11 +202,8 @@ async def upload_bylaws(file: UploadFile = File(...)):
 async def submit_change_request(request: ChangeRequest):
     """Submit a request for home modifications"""
     try:
-        request_id = f"REQ-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Save request to file (in production, use a database)
-        requests_dir = "requests"
-        os.makedirs(requests_dir, exist_ok=True)
+        now = datetime.now()
+        request_id = f"REQ-{now.strftime('%Y%m%d%H%M%S')}"
         
         request_data = {
             "request_id": request_id,
@@ -126,11 +214,16 @@ async def submit_change_request(request: ChangeRequest):
             "description": request.description,
             "urgency": request.urgency,
             "status": "submitted",
-            "submitted_at": datetime.now().isoformat()
+            "submitted_at": now.isoformat()
         }
         
-        with open(f"{requests_dir}/{request_id}.json", "w") as f:
-            json.dump(request_data, f, indent=2)
+        # Append to the day's JSONL file (in production, use a database);
+        # fsync is left to the background flusher
+        path = requests_file(now)
+        async with aiofiles.open(path, "a") as f:
+            await f.write(json.dumps(request_data) + "\n")
+        pending_fsync.add(path)
+        requests_written.set()
         
         return ChangeRequestResponse(
             request_id=request_id,
@@ -162,12 +255,8 @@ async def test_llm():
             return {"status": "error", "message": "LLM not initialized"}
         
         # Simple test query
-        loop = asyncio.get_event_loop()
         response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                lambda: rag_service.llm.invoke("Say 'Hello'")
-            ),
+            asyncio.to_thread(rag_service.llm.invoke, "Say 'Hello'"),
             timeout=10.0
         )
         
@@ -188,5 +277,15 @@ async def test_llm():
         }
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker loads its own RAGService; the FAISS index is memory-mapped
+    # so workers share its pages. uvloop is not available on Windows.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
@@ -1,18 +1,200 @@
 from __future__ import annotations
 from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_community.llms import Ollama
 from langchain_huggingface import HuggingFaceEmbeddings, HuggingFaceEndpoint
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+from operator import itemgetter
+import faiss
+import numpy as np
+import torch
 import os
 import asyncio
+import bisect
+import functools
+import json
+import math
+import pickle
+import requests
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Any
+import uuid
+from collections import OrderedDict
+from filelock import FileLock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import re2 as re  # RE2: linear-time DFA matching
+except ImportError:
+    import re
+
+# IVF index settings: faiss wants roughly 39 training points per cell, so
+# small corpora stay on an exact flat index until they are large enough
+IVF_MIN_POINTS_PER_LIST = 39
+IVF_NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+IVF_RETRAIN_FACTOR = 4
+FAISS_INT8 = os.getenv("FAISS_INT8", "true").lower() == "true"
+
+# All static prompt text comes first so Ollama can reuse the KV cache for
+# this prefix across requests; only context and question change per query
+PROMPT_PREFIX = """You are an HOA assistant. Answer based on the context below. Be concise.
+
+"""
+# Fixed context size: a different num_ctx per request would force a reload
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+
+# Large PDFs are parsed in page ranges so one document can use several processes
+PAGES_PER_TASK = 16
+PAGE_PARALLEL_MIN_PAGES = 64
+
+def load_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> List[Document]:
+    """Extract pages [start, end) of a PDF, one Document per page
+    
+    Uses PyMuPDF when it is installed and falls back to PyPDFLoader.
+    """
+    if fitz is not None:
+        try:
+            with fitz.open(file_path) as doc:
+                end = doc.page_count if end is None else min(end, doc.page_count)
+                return [
+                    Document(
+                        page_content=doc.load_page(i).get_text(),
+                        metadata={"source": file_path, "page": i}
+                    )
+                    for i in range(start, end)
+                ]
+        except Exception as e:
+            print(f"PyMuPDF failed on {file_path}, falling back to PyPDF: {e}")
+    documents = PyPDFLoader(file_path).load()
+    if end is None:
+        end = len(documents)
+    return [doc for doc in documents if start <= doc.metadata.get("page", 0) < end]
+
+def pdf_page_count(file_path: str) -> Optional[int]:
+    """Number of pages in a PDF, or None if PyMuPDF is unavailable or can't open it"""
+    if fitz is None:
+        return None
+    try:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+def pdf_page_ranges(page_count: Optional[int]) -> List[Tuple[int, Optional[int]]]:
+    """Split a PDF into page ranges for parallel parsing (whole file if the count is unknown)"""
+    if not page_count:
+        return [(0, None)]
+    return [(i, i + PAGES_PER_TASK) for i in range(0, page_count, PAGES_PER_TASK)]
+
+# Chunk boundaries, strongest first: paragraph, line, sentence, word
+_SEP_RE = re.compile(r"\n\n|\n|\. |\? |! | ")
+_SEP_RANKS = {"\n\n": 0, "\n": 1, ". ": 2, "? ": 2, "! ": 2, " ": 3}
+
+def fast_split(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """Split text into overlapping chunks in one pass over the separator matches
+    
+    Each chunk ends at the strongest separator in the second half of its window
+    (falling back to any separator, then a hard cut), like
+    RecursiveCharacterTextSplitter but without re-splitting recursively.
+    """
+    positions_by_rank: List[List[int]] = [[], [], [], []]
+    all_positions = []
+    for match in _SEP_RE.finditer(text):
+        positions_by_rank[_SEP_RANKS[match.group()]].append(match.end())
+        all_positions.append(match.end())
+    
+    def best_cut(lo: int, hi: int) -> Optional[int]:
+        for positions in positions_by_rank:
+            i = bisect.bisect_right(positions, hi) - 1
+            if i >= 0 and positions[i] > lo:
+                return positions[i]
+        return None
+    
+    chunks = []
+    start = 0
+    while start < len(text):
+        limit = start + chunk_size
+        if limit >= len(text):
+            cut = len(text)
+        else:
+            cut = best_cut(start + chunk_size // 2, limit) or best_cut(start, limit) or limit
+        
+        chunk = text[start:cut].strip()
+        if chunk:
+            chunks.append(chunk)
+        if cut >= len(text):
+            break
+        
+        # Start the next chunk on a separator roughly chunk_overlap before the cut
+        i = bisect.bisect_left(all_positions, cut - chunk_overlap)
+        next_start = all_positions[i] if i < len(all_positions) else cut
+        start = next_start if start < next_start < cut else cut
+    return chunks
+
+def parse_and_split(file_path: str, start: int = 0, end: Optional[int] = None) -> List[Document]:
+    """Load a PDF (or a page range of it) and split it into chunks
+    
+    Module-level so worker processes can pickle it.
+    """
+    return [
+        Document(page_content=chunk, metadata=dict(doc.metadata))
+        for doc in load_pdf_pages(file_path, start, end)
+        for chunk in fast_split(doc.page_content, chunk_size=1000, chunk_overlap=200)
+    ]
+
+class InferenceModeHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFace embeddings that encode under torch.inference_mode"""
+    
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._client.eval()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with torch.inference_mode():
+            return super().embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        with torch.inference_mode():
+            return super().embed_query(text)
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings proxy that memoizes embed_query results
+    
+    Bulk embed_documents calls go straight to the wrapped model.
+    """
+    
+    def __init__(self, inner: Embeddings, maxsize: int = 2048):
+        self.inner = inner
+        self._embed_query = functools.lru_cache(maxsize=maxsize)(self._embed_normalized)
+    
+    def _embed_normalized(self, text: str) -> tuple:
+        return tuple(self.inner.embed_query(text))
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return list(self._embed_query(" ".join(text.split())))
+
+def _embedding_dtype():
+    """Pick the embedding model precision: FP16 on GPU, FP32 on CPU unless overridden"""
+    dtype = os.getenv("EMBEDDING_DTYPE", "auto").lower()
+    if dtype == "auto":
+        return torch.float16 if torch.cuda.is_available() else torch.float32
+    if dtype not in ("float16", "bfloat16", "float32"):
+        raise Exception(f"Unknown embedding dtype: {dtype}")
+    return getattr(torch, dtype)
 
 class RAGService:
     def __init__(self):
@@ -21,7 +203,40 @@ class RAGService:
         self.qa_chain = None
         self.llm = None
         self.persist_directory = "./faiss_index"
-        self.executor = ThreadPoolExecutor(max_workers=3)
+        # Serializes index reload/add/save across uvicorn worker processes
+        self._index_file_lock = FileLock(self.persist_directory + ".lock")
+        self._index_mmapped = False
+        self._index_mtime = None
+        # Exact-match answer cache keyed on the normalized question
+        self.cache_file = "./cache/qa_cache.json"
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        self._cache_file_lock = FileLock("./cache/caches.lock")
+        self.cache_size = int(os.getenv("QA_CACHE_SIZE", "512"))
+        self._answer_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # Bumped whenever the corpus changes, so in-flight queries don't cache stale answers
+        self._corpus_generation = 0
+        self._cache_lock = asyncio.Lock()
+        self._index_lock = asyncio.Lock()
+        # Micro-batching of concurrent queries (queue and worker start lazily
+        # so they bind to the running event loop)
+        self.batch_size = int(os.getenv("QUERY_BATCH_SIZE", "4"))
+        self.batch_window = float(os.getenv("QUERY_BATCH_WINDOW_MS", "20")) / 1000
+        self._query_queue = None
+        self._batch_worker = None
+        self._batch_tasks = set()
+        # Each in-flight batch holds one thread until all of its questions are
+        # answered and runs up to batch_size LLM calls. Allow only as many
+        # batches as needed to keep OLLAMA_NUM_PARALLEL calls busy; further
+        # batches wait here instead of piling onto the LLM server.
+        llm_parallel = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, math.ceil(llm_parallel / self.batch_size)))
+        # Semantic cache: paraphrased questions reuse an earlier answer
+        self.semantic_index_file = "./cache/semantic_cache.faiss"
+        self.semantic_entries_file = "./cache/semantic_cache.json"
+        self.similarity_threshold = float(os.getenv("CACHE_SIM_THRESHOLD", "0.92"))
+        self._semantic_index = None
+        self._semantic_entries: List[Dict[str, Any]] = []
+        self._load_answer_cache()
         self._initialize()
     
     def _get_llm(self):
@@ -45,6 +260,8 @@ class RAGService:
                 base_url=base_url,
                 model=model,
                 temperature=0,
+                keep_alive=-1,  # Keep the model loaded between queries
+                num_ctx=OLLAMA_NUM_CTX,
                 timeout=120  # 120 second timeout for slow systems
             )
         
@@ -64,7 +281,10 @@ class RAGService:
             raise Exception(f"Unknown LLM provider: {provider}")
     
     def _get_embeddings(self):
-        """Get embeddings based on configuration"""
+        """Get embeddings based on configuration, with query embeddings cached"""
+        return CachedEmbeddings(self._get_base_embeddings())
+    
+    def _get_base_embeddings(self):
         provider = os.getenv("EMBEDDING_PROVIDER", "huggingface").lower()
         
         if provider == "openai":
@@ -75,7 +295,19 @@ class RAGService:
         
         elif provider == "huggingface":
             model = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-            return HuggingFaceEmbeddings(model_name=model)
+            # Larger batches keep the transformer busy during bulk indexing
+            return InferenceModeHuggingFaceEmbeddings(
+                model_name=model,
+                model_kwargs={
+                    "device": "cuda" if torch.cuda.is_available() else "cpu",
+                    "model_kwargs": {"torch_dtype": _embedding_dtype()}
+                },
+                encode_kwargs={
+                    "batch_size": 64,
+                    "normalize_embeddings": True,
+                    "convert_to_numpy": True
+                }
+            )
         
         else:
             raise Exception(f"Unknown embedding provider: {provider}")
@@ -86,6 +318,7 @@ class RAGService:
             # Get embeddings
             self.embeddings = self._get_embeddings()
             print(f"✓ Embeddings initialized: {os.getenv('EMBEDDING_PROVIDER', 'huggingface')}")
+            self._initialize_semantic_cache()
             
             # Get LLM
             self.llm = self._get_llm()
@@ -96,11 +329,8 @@ class RAGService:
             # Load existing vectorstore or create new one
             index_file = os.path.join(self.persist_directory, "index.faiss")
             if os.path.exists(index_file):
-                self.vectorstore = FAISS.load_local(
-                    self.persist_directory,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
+                with self._index_file_lock:
+                    self.vectorstore = self._load_vectorstore()
                 self._initialize_qa_chain()
                 print(f"✓ Loaded existing vector store with documents")
             else:
@@ -112,20 +342,128 @@ class RAGService:
             print(f"Error initializing RAG service: {e}")
             print("Check your .env file configuration.")
     
+    def _read_index(self, mmap: bool) -> faiss.Index:
+        index_file = os.path.join(self.persist_directory, "index.faiss")
+        flags = 0
+        if mmap:
+            with open(index_file, "rb") as f:
+                fourcc = f.read(4)
+            if fourcc.startswith(b"IxF"):
+                # Flat indexes (IndexFlatIP/L2) only map their codes with MMAP_IFC;
+                # IO_FLAG_MMAP alone copies them into RAM
+                flags = faiss.IO_FLAG_MMAP_IFC
+            else:
+                # IVF indexes map their inverted lists
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(index_file, flags)
+        if isinstance(index, faiss.IndexIVF):
+            index.nprobe = IVF_NPROBE
+        return index
+    
+    def _load_vectorstore(self) -> FAISS:
+        """Load the persisted vectorstore with the index memory-mapped
+        
+        Pages are read on demand and shared between workers through the page
+        cache. The mapped index is read-only (adding to a mapped flat index
+        aborts the process), so _make_index_writable must be called first.
+        """
+        index = self._read_index(mmap=True)
+        with open(os.path.join(self.persist_directory, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        self._index_mmapped = True
+        self._index_mtime = os.path.getmtime(os.path.join(self.persist_directory, "index.faiss"))
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+    
+    def _load_vectorstore_locked(self) -> FAISS:
+        with self._index_file_lock:
+            return self._load_vectorstore()
+    
+    def _index_changed_on_disk(self) -> bool:
+        try:
+            return os.path.getmtime(os.path.join(self.persist_directory, "index.faiss")) != self._index_mtime
+        except OSError:
+            return False
+    
+    def _update_vectorstore(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict], replace: bool):
+        """Add embedded chunks to the index and save it (blocking)
+        
+        Runs under the cross-process file lock and first reloads the index if
+        another worker saved a newer one, so concurrent uploads in different
+        workers never overwrite each other.
+        """
+        with self._index_file_lock:
+            if not replace and self._index_changed_on_disk():
+                self.vectorstore = self._load_vectorstore()
+            
+            if self.vectorstore and not replace:
+                self._make_index_writable()
+                self.vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+                self._maybe_retrain_index()
+            else:
+                # Create new vectorstore with these documents
+                self.vectorstore = self._create_vectorstore(texts, vectors, metadatas)
+                self._index_mmapped = False
+            
+            self._save_vectorstore()
+    
+    def _make_index_writable(self):
+        """Swap a memory-mapped index for an in-memory copy before adding to it"""
+        if self._index_mmapped:
+            self.vectorstore.index = self._read_index(mmap=False)
+            self._index_mmapped = False
+    
+    def _save_vectorstore(self):
+        """Save the vectorstore, replacing the old files atomically
+        
+        Writing to a temp folder and renaming keeps any memory-mapped copy of
+        the previous index valid instead of truncating it underneath readers.
+        Callers hold _index_file_lock, so other workers never read a half-replaced pair.
+        """
+        tmp_directory = f"{self.persist_directory}.tmp-{os.getpid()}"
+        os.makedirs(self.persist_directory, exist_ok=True)
+        self.vectorstore.save_local(tmp_directory)
+        for name in ("index.faiss", "index.pkl"):
+            os.replace(os.path.join(tmp_directory, name), os.path.join(self.persist_directory, name))
+        os.rmdir(tmp_directory)
+        self._index_mtime = os.path.getmtime(os.path.join(self.persist_directory, "index.faiss"))
+    
+    async def _reload_if_changed(self):
+        """Pick up an index saved by another worker process"""
+        try:
+            mtime = os.path.getmtime(os.path.join(self.persist_directory, "index.faiss"))
+        except OSError:
+            return
+        if mtime == self._index_mtime or not self.llm:
+            return
+        
+        async with self._index_lock:
+            if mtime == self._index_mtime:
+                return
+            self.vectorstore = await asyncio.to_thread(self._load_vectorstore_locked)
+        print("✓ Reloaded vector store updated by another worker")
+        
+        async with self._cache_lock:
+            self.clear_answer_cache()
+        self._initialize_qa_chain()
+    
     def _initialize_qa_chain(self):
         """Initialize or reinitialize the QA chain"""
         try:
             if not self.llm or not self.vectorstore:
                 return
             
-            # Create prompt template (simplified for speed)
-            prompt = ChatPromptTemplate.from_template("""You are an HOA assistant. Answer based on the context below. Be concise.
-
-Context: {context}
-
-Question: {question}
-
-Answer:""")
+            # The template is static, so render it with a plain f-string
+            # instead of LangChain's prompt machinery (simplified for speed)
+            def render(context, question):
+                return f"{PROMPT_PREFIX}Context: {context}\n\nQuestion: {question}\n\nAnswer:"
+            
+            prompt = RunnableLambda(lambda x: render(x["context"], x["question"]))
             
             # Create retrieval chain using LCEL
             # Reduced from k=4 to k=2 for faster performance
@@ -134,96 +472,509 @@ Answer:""")
             def format_docs(docs):
                 return "\n\n".join(doc.page_content for doc in docs)
             
+            # Retrieve once; the same docs feed the prompt and the sources list
             self.qa_chain = (
-                {"context": retriever | format_docs, "question": RunnablePassthrough()}
-                | prompt
-                | self.llm
-                | StrOutputParser()
+                {"docs": retriever, "question": RunnablePassthrough()}
+                | RunnableLambda(lambda x: {
+                    "context": format_docs(x["docs"]),
+                    "question": x["question"],
+                    "docs": x["docs"]
+                })
+                | RunnableParallel(
+                    answer=prompt | self.llm | StrOutputParser(),
+                    docs=itemgetter("docs")
+                )
             )
-            self.retriever = retriever
             
         except Exception as e:
             print(f"Error initializing QA chain: {e}")
     
+    @staticmethod
+    def _cache_key(question: str) -> str:
+        return question.strip().lower()
+    
+    def _load_answer_cache(self):
+        """Load persisted answers from a previous run"""
+        try:
+            with self._cache_file_lock:
+                entries = self._read_answer_cache_file()
+            for key, value in entries[-self.cache_size:]:
+                self._answer_cache[key] = value
+            if self._answer_cache:
+                print(f"✓ Loaded {len(self._answer_cache)} cached answers")
+        except Exception as e:
+            print(f"Error loading answer cache: {e}")
+    
+    def _read_answer_cache_file(self) -> list:
+        if not os.path.exists(self.cache_file):
+            return []
+        with open(self.cache_file, "r") as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _write_json_atomic(path: str, data):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    
+    def save_answer_cache(self):
+        """Persist the answer cache so warm restarts keep their hits
+        
+        Entries already on disk (saved by other workers) are merged, with this
+        process's entries treated as most recent. Callers hold _cache_file_lock.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            merged = OrderedDict(
+                (key, value) for key, value in self._read_answer_cache_file()
+                if key not in self._answer_cache
+            )
+            merged.update(self._answer_cache)
+            self._write_json_atomic(self.cache_file, list(merged.items())[-self.cache_size:])
+        except Exception as e:
+            print(f"Error saving answer cache: {e}")
+    
+    def clear_answer_cache(self):
+        """Drop cached answers (new documents can change them)"""
+        self._corpus_generation += 1
+        self._answer_cache.clear()
+        if self._semantic_index is not None:
+            self._semantic_index.reset()
+        self._semantic_entries = []
+        with self._cache_file_lock:
+            for path in (self.cache_file, self.semantic_index_file, self.semantic_entries_file):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def _initialize_semantic_cache(self):
+        """Create (or load) the embedding index used by the semantic cache"""
+        try:
+            dimension = len(self.embeddings.embed_query("x"))
+            with self._cache_file_lock:
+                index, entries = self._read_semantic_cache_files(dimension)
+            if index is not None:
+                self._semantic_index = index
+                self._semantic_entries = entries
+                self._trim_semantic_cache()
+                print(f"✓ Loaded {len(self._semantic_entries)} semantic cache entries")
+                return
+            # Missing or inconsistent files: start with an empty cache
+            self._semantic_index = faiss.IndexFlatIP(dimension)
+            self._semantic_entries = []
+        except Exception as e:
+            print(f"Error initializing semantic cache: {e}")
+            self._semantic_index = None
+            self._semantic_entries = []
+    
+    def _read_semantic_cache_files(self, dimension: int):
+        """Read the persisted semantic cache, or (None, []) if missing or unusable"""
+        if not (os.path.exists(self.semantic_index_file) and os.path.exists(self.semantic_entries_file)):
+            return None, []
+        index = faiss.read_index(self.semantic_index_file)
+        with open(self.semantic_entries_file, "r") as f:
+            entries = json.load(f)
+        # Discard caches written by a different embedding model or in another format
+        if index.d != dimension or index.ntotal != len(entries):
+            return None, []
+        if not all(isinstance(entry, dict) and "question" in entry for entry in entries):
+            return None, []
+        return index, entries
+    
+    def _remove_semantic_entry(self, position: int):
+        # Flat index ids are compacted on removal, like list.pop
+        self._semantic_index.remove_ids(np.array([position], dtype="int64"))
+        return self._semantic_entries.pop(position)
+    
+    def _trim_semantic_cache(self):
+        """Evict least recently used entries beyond cache_size"""
+        while len(self._semantic_entries) > self.cache_size:
+            self._remove_semantic_entry(0)
+    
+    def _save_semantic_cache(self):
+        """Persist the semantic cache, merged with entries saved by other workers
+        
+        Callers hold _cache_file_lock.
+        """
+        if self._semantic_index is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.semantic_index_file), exist_ok=True)
+            # Merge by question key, like save_answer_cache: this process's
+            # entries (which include any copies loaded at startup) win and
+            # count as most recent
+            merged: OrderedDict[str, tuple] = OrderedDict()
+            saved_index, saved_entries = self._read_semantic_cache_files(self._semantic_index.d)
+            for source, source_entries in ((saved_index, saved_entries), (self._semantic_index, self._semantic_entries)):
+                if source is None or not source.ntotal:
+                    continue
+                vectors = source.reconstruct_n(0, source.ntotal)
+                for vector, entry in zip(vectors, source_entries):
+                    merged.pop(entry["question"], None)
+                    merged[entry["question"]] = (vector, entry)
+            kept = list(merged.values())[-self.cache_size:]
+            
+            index = faiss.IndexFlatIP(self._semantic_index.d)
+            if kept:
+                index.add(np.array([vector for vector, _ in kept], dtype="float32"))
+            entries = [entry for _, entry in kept]
+            
+            tmp_index_file = f"{self.semantic_index_file}.tmp-{os.getpid()}"
+            faiss.write_index(index, tmp_index_file)
+            os.replace(tmp_index_file, self.semantic_index_file)
+            self._write_json_atomic(self.semantic_entries_file, entries)
+        except Exception as e:
+            print(f"Error saving semantic cache: {e}")
+    
+    def save_caches(self):
+        """Persist all answer caches (called on shutdown)"""
+        if self._index_changed_on_disk():
+            # Another worker indexed documents after these answers were cached
+            return
+        with self._cache_file_lock:
+            self.save_answer_cache()
+            self._save_semantic_cache()
+    
+    def _embed_question(self, question: str) -> np.ndarray:
+        """Embed a question as an L2-normalized row vector for cosine lookups"""
+        vector = np.array([self.embeddings.embed_query(question)], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def _semantic_lookup(self, vector: np.ndarray):
+        if self._semantic_index is None or self._semantic_index.ntotal == 0:
+            return None
+        scores, ids = self._semantic_index.search(vector, 1)
+        if ids[0][0] < 0 or scores[0][0] < self.similarity_threshold:
+            return None
+        # Move the hit to the end so eviction stays least-recently-used
+        position = int(ids[0][0])
+        cached_vector = self._semantic_index.reconstruct(position).reshape(1, -1)
+        entry = self._remove_semantic_entry(position)
+        self._semantic_index.add(cached_vector)
+        self._semantic_entries.append(entry)
+        return entry["result"]
+    
+    def uses_ollama(self) -> bool:
+        return self.llm is not None and os.getenv("LLM_PROVIDER", "ollama").lower() == "ollama"
+    
+    def ping_ollama(self):
+        """Ask Ollama to keep the model loaded without generating anything (blocking)"""
+        base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        model = os.getenv("OLLAMA_MODEL", "mistral")
+        response = requests.post(
+            f"{base_url}/api/generate",
+            # num_ctx must match the LLM's, otherwise Ollama reloads the model
+            json={
+                "model": model,
+                "prompt": "",
+                "keep_alive": -1,
+                "options": {"num_predict": 1, "num_ctx": OLLAMA_NUM_CTX}
+            },
+            timeout=120
+        )
+        response.raise_for_status()
+    
     def is_initialized(self) -> bool:
         """Check if RAG service is properly initialized"""
         return self.qa_chain is not None
     
+    @staticmethod
+    def _build_index(vectors: np.ndarray) -> faiss.Index:
+        """Build an inner-product index, partitioned into IVF cells once the corpus is large enough
+        
+        Small corpora use an exact flat index. IVF indexes store vectors as int8
+        scalar-quantized codes (4x smaller than FP32) unless FAISS_INT8 is
+        disabled; they are only built once there is enough data to train the
+        quantizer on a representative sample.
+        """
+        count, dimension = vectors.shape
+        nlist = max(8, int(math.sqrt(count)))
+        metric = faiss.METRIC_INNER_PRODUCT
+        if count < nlist * IVF_MIN_POINTS_PER_LIST:
+            index = faiss.IndexFlatIP(dimension)
+        else:
+            quantizer = faiss.IndexFlatIP(dimension)
+            if FAISS_INT8:
+                index = faiss.IndexIVFScalarQuantizer(
+                    quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit, metric
+                )
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+            index.train(vectors)
+            index.nprobe = IVF_NPROBE
+        index.add(vectors)
+        return index
+    
+    def _create_vectorstore(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> FAISS:
+        """Wrap a freshly built index and its documents in a LangChain FAISS store"""
+        index = self._build_index(np.array(vectors, dtype="float32"))
+        ids = [str(uuid.uuid4()) for _ in texts]
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        })
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+    
+    def _maybe_retrain_index(self):
+        """Rebuild the index when the corpus has outgrown its IVF training set"""
+        index = self.vectorstore.index
+        lossy = isinstance(index, faiss.IndexIVFScalarQuantizer)
+        if isinstance(index, faiss.IndexIVF):
+            # nlist was chosen as sqrt(training size)
+            needs_rebuild = index.ntotal > IVF_RETRAIN_FACTOR * index.nlist ** 2
+        else:
+            nlist = max(8, int(math.sqrt(index.ntotal)))
+            needs_rebuild = index.ntotal >= nlist * IVF_MIN_POINTS_PER_LIST
+        if not needs_rebuild:
+            return
+        
+        # Vectors are re-added in the same order, so docstore ids stay valid
+        if lossy:
+            # Quantized codes only decode approximately; retraining on them would
+            # compound the error, so re-embed the original text instead
+            texts = [
+                self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i]).page_content
+                for i in range(index.ntotal)
+            ]
+            vectors = np.array(self.embeddings.embed_documents(texts), dtype="float32")
+        else:
+            if isinstance(index, faiss.IndexIVF):
+                index.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal)
+        self.vectorstore.index = self._build_index(vectors)
+        print(f"✓ Rebuilt vector index over {index.ntotal} chunks")
+    
     async def index_document(self, file_path: str):
         """Index a PDF document into the vectorstore"""
+        await self.index_documents([file_path])
+    
+    async def index_documents(self, file_paths: List[str], replace: bool = False) -> Dict[str, Exception]:
+        """Index several PDF documents, parsing them in parallel worker processes
+        
+        If replace is True the existing vectorstore is rebuilt from these files only.
+        Files that fail to parse are skipped and returned with their errors; if
+        every file fails the first error is raised.
+        """
         try:
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
+            # fitz.open can read the whole file when repairing a damaged PDF
+            page_counts = await asyncio.to_thread(
+                lambda: {path: pdf_page_count(path) for path in file_paths}
             )
+            tasks = [
+                (path, start, end)
+                for path in file_paths
+                for start, end in pdf_page_ranges(page_counts[path])
+            ]
+            total_pages = sum(count or 0 for count in page_counts.values())
+            if len(file_paths) > 1 or total_pages >= PAGE_PARALLEL_MIN_PAGES:
+                # PDF parsing is CPU-bound, so fan page ranges out across processes
+                loop = asyncio.get_running_loop()
+                workers = min(os.cpu_count() or 1, len(tasks))
+                pool = ProcessPoolExecutor(max_workers=workers)
+                try:
+                    results = await asyncio.gather(
+                        *(loop.run_in_executor(pool, parse_and_split, *task) for task in tasks),
+                        return_exceptions=True
+                    )
+                finally:
+                    # shutdown waits for the worker processes to exit
+                    await asyncio.to_thread(pool.shutdown)
+            else:
+                # Not worth spawning a process for a small upload, but keep
+                # the parse off the event loop
+                tasks = [(path, 0, None) for path in file_paths]
+                results = []
+                for path in file_paths:
+                    try:
+                        results.append(await asyncio.to_thread(parse_and_split, path))
+                    except Exception as e:
+                        results.append(e)
             
-            chunks = text_splitter.split_documents(documents)
+            failures: Dict[str, Exception] = {}
+            for (path, _, _), result in zip(tasks, results):
+                if isinstance(result, Exception):
+                    failures.setdefault(path, result)
+            if failures and len(failures) == len(file_paths):
+                raise next(iter(failures.values()))
             
-            # Add to vectorstore
-            if self.vectorstore:
-                self.vectorstore.add_documents(chunks)
-            else:
-                # Create new vectorstore with first documents
-                self.vectorstore = FAISS.from_documents(chunks, self.embeddings)
+            chunks = [
+                chunk
+                for (path, _, _), result in zip(tasks, results)
+                if path not in failures
+                for chunk in result
+            ]
+            if not chunks:
+                raise Exception("No text could be extracted from the documents")
+            all_texts = [chunk.page_content for chunk in chunks]
+            all_metas = [chunk.metadata for chunk in chunks]
+            
+            # Embedding, FAISS updates and disk writes all block, so run them in
+            # threads; the locks keep concurrent uploads from interleaving
+            async with self._index_lock:
+                # Embed every chunk from this session in one batched call
+                vectors = await asyncio.to_thread(self.embeddings.embed_documents, all_texts)
+                await asyncio.to_thread(self._update_vectorstore, all_texts, vectors, all_metas, replace)
             
-            # Save vectorstore
-            os.makedirs(self.persist_directory, exist_ok=True)
-            self.vectorstore.save_local(self.persist_directory)
+            # Cached answers may be stale now that the corpus changed
+            async with self._cache_lock:
+                self.clear_answer_cache()
             
             # Reinitialize QA chain with updated vectorstore
             self._initialize_qa_chain()
+            return failures
             
         except Exception as e:
             raise Exception(f"Error indexing document: {e}")
     
+    async def _batched_invoke(self, question: str) -> Dict[str, Any]:
+        """Queue a question for the next QA chain batch and wait for its result"""
+        if self._batch_worker is None:
+            self._query_queue = asyncio.Queue()
+            self._batch_worker = asyncio.create_task(self._batch_loop())
+        future = asyncio.get_running_loop().create_future()
+        await self._query_queue.put((question, future))
+        return await future
+    
+    async def _batch_loop(self):
+        """Collect questions arriving within the batch window and dispatch them together"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._query_queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._query_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Keep a reference so the task isn't garbage collected mid-flight
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    def close(self):
+        """Stop the batch worker and in-flight batches (called on shutdown)"""
+        if self._batch_worker is not None:
+            self._batch_worker.cancel()
+        for task in list(self._batch_tasks):
+            task.cancel()
+        self.executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _resolve_future(future: asyncio.Future, output):
+        if future.done():
+            # Caller gave up (e.g. request timeout)
+            return
+        if isinstance(output, Exception):
+            future.set_exception(output)
+        else:
+            future.set_result(output)
+    
+    async def _run_batch(self, batch):
+        questions = [question for question, _ in batch]
+        if len(batch) > 1:
+            print(f"Batching {len(batch)} concurrent questions")
+        loop = asyncio.get_running_loop()
+        
+        def run():
+            # Each question runs its own retrieval and LLM call concurrently, so
+            # Ollama (with OLLAMA_NUM_PARALLEL) or OpenAI can serve them together;
+            # every caller is resolved as soon as its own answer is ready
+            for i, output in self.qa_chain.batch_as_completed(
+                questions,
+                config={"max_concurrency": len(questions)},
+                return_exceptions=True
+            ):
+                loop.call_soon_threadsafe(self._resolve_future, batch[i][1], output)
+        
+        try:
+            await loop.run_in_executor(self.executor, run)
+        except Exception as e:
+            # Scheduled so answers already queued by run() are delivered first
+            for _, future in batch:
+                loop.call_soon(self._resolve_future, future, e)
+    
     async def query(self, question: str) -> Dict[str, Any]:
         """Query the RAG system with a question"""
+        await self._reload_if_changed()
         if not self.qa_chain:
             raise Exception("RAG service not initialized. Please upload documents first or check your configuration.")
         
+        key = self._cache_key(question)
+        async with self._cache_lock:
+            generation = self._corpus_generation
+            cached = self._answer_cache.get(key)
+            if cached is not None:
+                self._answer_cache.move_to_end(key)
+                print(f"Cache hit for question: {question[:50]}...")
+                return cached
+        
         try:
             start_time = time.time()
             
-            # Run blocking operations in thread pool
-            loop = asyncio.get_event_loop()
+            # Check the semantic cache for a paraphrase of an earlier question
+            # (blocking embed; kept off the LLM pool so cache hits never wait
+            # behind in-flight LLM calls)
+            question_vector = None
+            if self._semantic_index is not None:
+                question_vector = await asyncio.to_thread(self._embed_question, question)
+                async with self._cache_lock:
+                    cached = self._semantic_lookup(question_vector)
+                if cached is not None:
+                    print(f"[{time.time()-start_time:.1f}s] Semantic cache hit for question: {question[:50]}...")
+                    return cached
             
             # Get answer from chain (blocking call)
             print(f"[{time.time()-start_time:.1f}s] Processing question: {question[:50]}...")
             
             answer_start = time.time()
-            answer = await loop.run_in_executor(
-                self.executor,
-                lambda: self.qa_chain.invoke(question)
-            )
+            output = await self._batched_invoke(question)
+            answer = output["answer"]
+            docs = output["docs"]
             answer_time = time.time() - answer_start
-            print(f"[{time.time()-start_time:.1f}s] Got answer in {answer_time:.1f}s: {answer[:100]}...")
-            
-            # Get relevant documents for sources (blocking call)
-            docs_start = time.time()
-            docs = await loop.run_in_executor(
-                self.executor,
-                lambda: self.retriever.get_relevant_documents(question)
-            )
-            docs_time = time.time() - docs_start
-            print(f"[{time.time()-start_time:.1f}s] Retrieved {len(docs)} documents in {docs_time:.1f}s")
+            print(f"[{time.time()-start_time:.1f}s] Got answer from {len(docs)} documents in {answer_time:.1f}s: {answer[:100]}...")
             
             sources = []
+            basename_cache = {}
             for doc in docs:
                 source = doc.metadata.get("source", "Unknown")
                 page = doc.metadata.get("page", "N/A")
-                sources.append(f"{os.path.basename(source)} (Page {page + 1})")
+                if source not in basename_cache:
+                    basename_cache[source] = os.path.basename(source)
+                sources.append(f"{basename_cache[source]} (Page {page + 1})")
             
             total_time = time.time() - start_time
             print(f"[{total_time:.1f}s] Query complete!")
             
-            return {
+            result = {
                 "answer": answer,
-                "sources": list(set(sources))
+                # Order-preserving dedupe keeps the top-ranked source first
+                "sources": list(dict.fromkeys(sources))
             }
+            
+            async with self._cache_lock:
+                if generation != self._corpus_generation:
+                    # Documents were indexed while this query ran
+                    return result
+                self._answer_cache[key] = result
+                self._answer_cache.move_to_end(key)
+                while len(self._answer_cache) > self.cache_size:
+                    self._answer_cache.popitem(last=False)
+                if question_vector is not None:
+                    self._semantic_index.add(question_vector)
+                    self._semantic_entries.append({"question": key, "result": result})
+                    self._trim_semantic_cache()
+            
+            return result
         except Exception as e:
             print(f"Error in query: {str(e)}")
             raise Exception(f"Error querying RAG system: {e}")
@@ -18,14 +18,17 @@ async def reindex_documents():
         print(f"  - {pdf}")
     
     print("\nIndexing documents...")
-    for pdf in pdf_files:
-        file_path = os.path.join(docs_dir, pdf)
-        print(f"\nIndexing {pdf}...")
-        try:
-            await rag.index_document(file_path)
-            print(f"✓ Successfully indexed {pdf}")
-        except Exception as e:
-            print(f"✗ Error indexing {pdf}: {e}")
+    file_paths = [os.path.join(docs_dir, pdf) for pdf in pdf_files]
+    try:
+        # Parse all PDFs in parallel and rebuild the index in one batch
+        failures = await rag.index_documents(file_paths, replace=True)
+        for pdf, file_path in zip(pdf_files, file_paths):
+            if file_path in failures:
+                print(f"✗ Error indexing {pdf}: {failures[file_path]}")
+            else:
+                print(f"✓ Successfully indexed {pdf}")
+    except Exception as e:
+        print(f"✗ Error indexing documents: {e}")
     
     print("\n" + "="*50)
     print("Re-indexing complete!")